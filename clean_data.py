@@ -1,85 +1,103 @@
 import pandas as pd
+import numpy as np
 import os
 import re
-from collections import defaultdict, Counter
+from functools import lru_cache
+from pathlib import Path
+from numba import njit
+from table_io import read_table, write_csv
 
-INPUT_FILENAME = "2025_PURE_CIVIL_WORKS_STRICT.csv"
-CLEAN_OUTPUT_FILENAME = "2025_CIVIL_WORKS_CLEANED.csv"
+INPUT_FILENAME = "2025_PURE_CIVIL_WORKS_STRICT.parquet"
+CLEAN_OUTPUT_FILENAME = "2025_CIVIL_WORKS_CLEANED.parquet"
 BUYER_MAP_FILENAME = "buyer_canonical_map.csv"
 
-
-def find_file(filename):
-    base = os.path.dirname(os.path.abspath(__file__))
-    for root, _, files in os.walk(base):
-        if filename in files:
-            return os.path.join(root, filename)
-    return None
-
-
-def basic_normalize(text):
-    if pd.isna(text):
-        return ""
-    text = str(text).strip().lower()
-    text = re.sub(r'\b(ltd\.?|limited)\b', 'limited', text)
-    text = re.sub(r'\b(plc\.?)\b', 'plc', text)
-    text = re.sub(r'\b(co\.?)\b', 'company', text)
-    text = re.sub(r'\b(gov\.?|govt)\b', 'government', text)
-    text = text.replace('&', 'and')
-    text = re.sub(r'\s+', ' ', text)
-    return text
+_LTD_RE = re.compile(r'\b(ltd\.?|limited)\b')
+_PLC_RE = re.compile(r'\b(plc\.?)\b')
+_CO_RE = re.compile(r'\b(co\.?)\b')
+_GOV_RE = re.compile(r'\b(gov\.?|govt)\b')
+_SPACE_RE = re.compile(r'\s+')
+_ACRONYM_RE = re.compile(r'(\S)\S*\s*')
+_NON_NUM = re.compile(r'[^\d.]')
 
 
-def acronym(text):
-    return ''.join(word[0] for word in text.split() if word).upper()
+@lru_cache(maxsize=128)
+def find_file(filename):
+    base = Path(__file__).resolve().parent
+    match = next(base.rglob(filename), None)
+    return str(match) if match else None
 
 
 def build_canonical_map(names):
-    clusters = defaultdict(list)
-
-    for name in names.dropna().unique():
-        norm = basic_normalize(name)
-        key = acronym(norm) if len(norm.split()) > 1 else norm.upper()
-        clusters[key].append(name)
-
-    canonical_rows = []
-
-    for key, variants in clusters.items():
-        acronym_matches = [
-            v for v in variants
-            if v.replace(" ", "").upper() == key
-        ]
-
-        canonical = (
-            acronym_matches[0]
-            if acronym_matches
-            else Counter(variants).most_common(1)[0][0]
-        )
-
-        for v in variants:
-            canonical_rows.append({
-                "buyer_name_raw": v,
-                "buyer_name_canonical": canonical
-            })
-
-    return pd.DataFrame(canonical_rows)
+    raw = pd.Series(names.dropna().unique())
+
+    norm = (
+        raw.astype(str).str.strip().str.lower()
+        .str.replace(_LTD_RE, 'limited', regex=True)
+        .str.replace(_PLC_RE, 'plc', regex=True)
+        .str.replace(_CO_RE, 'company', regex=True)
+        .str.replace(_GOV_RE, 'government', regex=True)
+        .str.replace('&', 'and', regex=False)
+        .str.replace(_SPACE_RE, ' ', regex=True)
+    )
+
+    multi_word = norm.str.split().str.len() > 1
+    acronyms = norm.str.replace(_ACRONYM_RE, r'\1', regex=True).str.upper()
+    key = acronyms.where(multi_word, norm.str.upper())
+
+    # Prefer a variant that is already the acronym, else the first seen.
+    acronym_match = raw.str.replace(" ", "", regex=False).str.upper() == key
+    first_seen = raw.groupby(key, sort=False).transform("first")
+    first_acronym = raw.where(acronym_match).groupby(key, sort=False).transform("first")
+
+    canonical_map = pd.DataFrame({
+        "buyer_name_raw": raw,
+        "buyer_name_canonical": first_acronym.fillna(first_seen),
+        "cluster": pd.factorize(key)[0]
+    })
+
+    return (
+        canonical_map.sort_values("cluster", kind="stable")
+        .drop(columns=["cluster"])
+        .reset_index(drop=True)
+    )
+
+
+@njit(cache=True)
+def _parse_money(buf):
+    # Keep digits and the decimal point, like _NON_NUM, then parse;
+    # anything float() would reject ("", ".", "1.2.3") gives 0.0.
+    digits = 0.0
+    scale = 1.0
+    seen_digit = False
+    seen_dot = False
+    for ch in buf:
+        if ch == 46:
+            if seen_dot:
+                return 0.0
+            seen_dot = True
+        elif 48 <= ch <= 57:
+            seen_digit = True
+            digits = digits * 10 + (ch - 48)
+            if seen_dot:
+                scale *= 10
+    if not seen_digit:
+        return 0.0
+    return digits / scale
 
 
 def clean_financials(val):
     if pd.isna(val):
         return 0.0
-    val = re.sub(r'[^\d.]', '', str(val))
-    try:
-        return float(val)
-    except ValueError:
-        return 0.0
+    return _parse_money(np.frombuffer(str(val).encode(), dtype=np.uint8))
 
 
 def run():
-    input_path = find_file(INPUT_FILENAME)
+    # Fall back to the CSV export when the Parquet intermediate is absent.
+    input_path = find_file(INPUT_FILENAME) or find_file(INPUT_FILENAME.replace(".parquet", ".csv"))
     if not input_path:
         raise FileNotFoundError(INPUT_FILENAME)
 
-    df = pd.read_csv(input_path)
+    df = read_table(input_path)
 
     df["buyer_name_raw"] = df["buyer_name"]
     buyer_map = build_canonical_map(df["buyer_name"])
@@ -87,14 +105,17 @@ def run():
     df["buyer_name"] = df["buyer_name_canonical"]
     df.drop(columns=["buyer_name_canonical"], inplace=True)
 
-    df["value_amount"] = df["value_amount"].apply(clean_financials)
+    df["value_amount"] = pd.to_numeric(
+        df["value_amount"].astype(str).str.replace(_NON_NUM, '', regex=True),
+        errors="coerce"
+    ).fillna(0.0)
 
     df = df.drop_duplicates(subset=["ocid"])
     df = df[df["value_amount"] > 0]
 
     out_dir = os.path.dirname(input_path)
-    df.to_csv(os.path.join(out_dir, CLEAN_OUTPUT_FILENAME), index=False)
-    buyer_map.to_csv(os.path.join(out_dir, BUYER_MAP_FILENAME), index=False)
+    df.to_parquet(os.path.join(out_dir, CLEAN_OUTPUT_FILENAME), index=False)
+    write_csv(buyer_map, os.path.join(out_dir, BUYER_MAP_FILENAME))
 
 
 if __name__ == "__main__":
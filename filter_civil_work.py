@@ -1,8 +1,8 @@
-import pandas as pd
 import os
+from table_io import read_table
 
 INPUT_FILE = "data/2025_construction_contracts.csv" 
-OUTPUT_FILE = "2025_PURE_CIVIL_WORKS_STRICT.csv"
+OUTPUT_FILE = "data/2025_PURE_CIVIL_WORKS_STRICT.parquet"
 
 
 ALLOWED_PREFIXES = (
@@ -17,22 +17,22 @@ ALLOWED_PREFIXES = (
 def filter_strict_cpvs():
     print(f"--- Processing {INPUT_FILE} ---")
     
-    try:
-        df = pd.read_csv(INPUT_FILE, encoding='utf-8')
-    except UnicodeDecodeError:
-        print("UTF-8 failed, trying Latin-1 encoding...")
-        df = pd.read_csv(INPUT_FILE, encoding='latin1')
+    df = read_table(INPUT_FILE)
         
     print(f"Original Row Count: {len(df)}")
     
-    df['cpv_code'] = df['cpv_code'].astype(str).str.strip()
+    # Prefix-match the few distinct CPV codes, then select rows by category code.
+    df['cpv_code'] = df['cpv_code'].astype(str).str.strip().astype('category')
+    df['buyer_country'] = df['buyer_country'].astype('category')
     
-    civil_mask = df['cpv_code'].str.startswith(ALLOWED_PREFIXES)
+    cats = df['cpv_code'].cat.categories
+    allowed_codes = [i for i, c in enumerate(cats) if c.startswith(ALLOWED_PREFIXES)]
+    civil_mask = df['cpv_code'].cat.codes.isin(allowed_codes)
     
     result_df = df[civil_mask]
 
 
-    result_df.to_csv(OUTPUT_FILE, index=False)
+    result_df.to_parquet(OUTPUT_FILE, index=False)
     
     print(f"\n--- Filtering Complete ---")
     print(f"Dropped {len(df) - len(result_df)} rows (Buildings/Generic/Noise).")
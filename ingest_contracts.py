@@ -1,10 +1,19 @@
 
-import requests
-import pandas as pd
-import time
+import aiohttp
+import asyncio
+import csv
+import pyarrow as pa
+import random
 import os
 import json
-from datetime import datetime
+from datetime import date, timedelta
+from table_io import read_table, write_csv
+
+try:
+    import orjson                   # much faster on large OCDS pages
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 
 API_URL = "https://www.contractsfinder.service.gov.uk/Published/Notices/OCDS/Search"
@@ -14,11 +23,23 @@ END_DATE   = "2025-12-31"
 
 OUTPUT_DIR = "data"
 OUTPUT_FILE = f"{OUTPUT_DIR}/2025_construction_contracts.csv"
-CURSOR_FILE = f"{OUTPUT_DIR}/last_cursor.txt"
+STREAM_FILE = f"{OUTPUT_DIR}/2025_construction_contracts.partial.csv"
+CURSOR_FILE = f"{OUTPUT_DIR}/last_cursor.json"
+
+OUTPUT_FIELDS = [
+    "ocid", "title", "description", "cpv_code", "value_amount", "currency",
+    "published_date", "buyer_name", "buyer_country", "tender_status", "source"
+]
+# The raw stream also records which window each row came from, so the
+# final dedup does not depend on the order concurrent windows finished in.
+STREAM_FIELDS = OUTPUT_FIELDS + ["window"]
 
 PAGE_LIMIT = 100
 SLEEP_SECONDS = 0.7
 MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0
+MAX_CONCURRENCY = 3     # pages in flight at once – keep low, it's a public API
+WINDOW_DAYS = 31        # date range is split into windows that paginate in parallel
 
 # Civil / Construction CPV prefixes
 CIVIL_WORKS_CPVS = [
@@ -29,13 +50,15 @@ CIVIL_WORKS_CPVS = [
 
 # SAFE REQUEST HANDLER
 
-def safe_get(url, params=None, retries=MAX_RETRIES, backoff=2):
+async def safe_get(session, url, params=None, retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+    """Return (status, body) for url, retrying network errors with jittered exponential backoff."""
     for attempt in range(retries):
         try:
-            return requests.get(url, params=params, timeout=40)
-        except requests.exceptions.RequestException as e:
+            async with session.get(url, params=params) as response:
+                return response.status, await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             print(f"[WARN] Network error ({attempt+1}/{retries}): {e}")
-            time.sleep(backoff * (attempt + 1))
+            await asyncio.sleep((1 + random.random()) * 2 ** attempt * backoff)
     raise RuntimeError("Max retries exceeded – aborting request")
 
 
@@ -77,124 +100,206 @@ def extract_value(tender, release):
     return 0, "GBP"
 
 
-def load_last_cursor():
+def date_windows(start, end, days=WINDOW_DAYS):
+    """
+    Split the [start, end] ISO date range into windows of `days` days.
+    Windows share their boundary date so no day is lost if the API reads a
+    bare date as midnight; the overlap is removed by the final dedup.
+    """
+    current = date.fromisoformat(start)
+    last = date.fromisoformat(end)
+    windows = []
+    while True:
+        window_end = min(current + timedelta(days=days), last)
+        windows.append((current.isoformat(), window_end.isoformat()))
+        if window_end >= last:
+            return windows
+        current = window_end
+
+
+def load_last_cursors():
     if os.path.exists(CURSOR_FILE):
         with open(CURSOR_FILE, "r") as f:
-            return f.read().strip()
-    return None
+            return json.load(f)
+    return {}
 
 
-def save_last_cursor(cursor_url):
+def save_last_cursors(cursors):
     with open(CURSOR_FILE, "w") as f:
-        f.write(cursor_url)
+        json.dump(cursors, f, indent=2)
+
+
+def parse_release(release):
+    """Return a flat contract row for a civil works release, or None to skip it."""
+    ocid = release.get("ocid")
+    if not ocid:
+        return None
+
+    tender = release.get("tender", {})
+    cpv = extract_cpv(tender, release)
+
+    if cpv == "UNKNOWN":
+        return None
+
+    if not any(cpv.startswith(prefix) for prefix in CIVIL_WORKS_CPVS):
+        return None
+
+    amount, currency = extract_value(tender, release)
+
+    buyer = release.get("buyer") or {}
+    parties = release.get("parties") or []
+
+    parties_by_id = {p.get("id"): p for p in parties if isinstance(p, dict)}
+    party = parties_by_id.get(buyer.get("id")) or {}
+    buyer_country = (party.get("address") or {}).get("countryName", "GB")
+
+    return {
+        "ocid": ocid,
+        "title": tender.get("title", "Unknown"),
+        "description": tender.get("description"),
+        "cpv_code": cpv,
+        "value_amount": amount,
+        "currency": currency,
+        "published_date": release.get("date"),
+        "buyer_name": buyer.get("name", "Unknown"),
+        "buyer_country": buyer_country,
+        "tender_status": tender.get("status"),
+        "source": "UK Contracts Finder"
+    }
 
 
 
 # MAIN INGESTION
 
+async def fetch_window(session, semaphore, window_index, window, cursors, writer, out_f):
+    """Follow the links.next cursor chain for one publishedFrom/publishedTo window."""
+    start, end = window
+    key = f"{start}_{end}"
+
+    next_url = cursors.get(key)
+    params = None
+    if next_url is None:
+        next_url = API_URL
+        params = {
+            "limit": PAGE_LIMIT,
+            "publishedFrom": start,
+            "publishedTo": end
+        }
+
+    page_count = 0
+    saved = 0
+
+    while True:
+        page_count += 1
+        print(f"[{start}] Fetching page {page_count}... (Saved {saved})")
+
+        async with semaphore:
+            status, body = await safe_get(session, next_url, params=params)
+
+        if status != 200:
+            print(f"[ERROR] [{start}] API returned:", status)
+            break
+
+        data = json_loads(body)
+        releases = data.get("releases", [])
+
+        if not releases:
+            print(f"[{start}] No more releases. End reached.")
+            break
+
+        batch = [
+            {**c, "window": window_index}
+            for c in map(parse_release, releases) if c is not None
+        ]
+        writer.writerows(batch)
+        out_f.flush()
+        saved += len(batch)
+
+        # Pagination – cursor is saved only once the page is on disk
+        if data.get("links") and data["links"].get("next"):
+            next_url = data["links"]["next"]
+            params = None
+            cursors[key] = next_url
+            save_last_cursors(cursors)
+        else:
+            print(f"[{start}] Pagination complete.")
+            break
+
+        await asyncio.sleep(SLEEP_SECONDS)
+
+
+async def fetch_all_windows(cursors, writer, out_f):
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=40)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        results = await asyncio.gather(
+            *(
+                fetch_window(session, semaphore, i, window, cursors, writer, out_f)
+                for i, window in enumerate(date_windows(START_DATE, END_DATE))
+            ),
+            return_exceptions=True
+        )
+
+    for result in results:
+        if isinstance(result, Exception):
+            print("[CRITICAL] Ingestion interrupted:", result)
+
+
+def compact_output():
+    """
+    Dedupe the streamed CSV on ocid and truncate descriptions in one pass.
+    Rows are put back in window order first (stable, so page order within a
+    window is kept) so keep="first" always picks the earliest window's row.
+    """
+    column_types = {field: pa.string() for field in OUTPUT_FIELDS}
+    column_types["window"] = pa.int32()
+    df = read_table(STREAM_FILE, column_types=column_types)
+    df = df.sort_values("window", kind="stable").drop(columns=["window"])
+    df = df.drop_duplicates(subset="ocid", keep="first", ignore_index=True)
+    df["description"] = df["description"].fillna("").str.slice(0, 500)
+
+    # Nothing fetched (e.g. API down) – keep the previous OUTPUT_FILE as is.
+    if df.empty:
+        return df
+
+    # Write beside the target and swap it in, so an interrupted write
+    # never leaves a truncated OUTPUT_FILE behind.
+    tmp_path = f"{OUTPUT_FILE}.tmp"
+    write_csv(df, tmp_path)
+    os.replace(tmp_path, OUTPUT_FILE)
+    return df
+
+
 def fetch_2025_construction_contracts():
     print("\n--- UK Contracts Finder | 2025 Construction Ingestion ---")
     print(f"Date range: {START_DATE} → {END_DATE}")
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    all_contracts = []
-    seen_ocids = set()
+    # Rows are streamed to disk page by page; a resumed run appends to them.
+    cursors = load_last_cursors()
+    resume = bool(cursors) and os.path.exists(STREAM_FILE)
 
-    params = {
-        "limit": PAGE_LIMIT,
-        "publishedFrom": START_DATE,
-        "publishedTo": END_DATE
-    }
+    with open(STREAM_FILE, "a" if resume else "w", newline="", encoding="utf-8") as out_f:
+        writer = csv.DictWriter(out_f, fieldnames=STREAM_FIELDS)
+        if out_f.tell() == 0:
+            writer.writeheader()
 
-    next_url = load_last_cursor()
-    first_page = next_url is None
-    page_count = 0
+        try:
+            asyncio.run(fetch_all_windows(cursors, writer, out_f))
+        except Exception as e:
+            print("[CRITICAL] Ingestion interrupted:", e)
+
+
+    # SAVE OUTPUT
+
+    df = compact_output()
+
+    print(f"\n--- DONE. Total 2025 construction contracts: {len(df)} ---")
 
-    try:
-        while True:
-            page_count += 1
-            print(f"Fetching page {page_count}... (Saved {len(all_contracts)})")
-
-            if first_page:
-                response = safe_get(API_URL, params=params)
-                first_page = False
-            else:
-                response = safe_get(next_url)
-
-            if response.status_code != 200:
-                print("[ERROR] API returned:", response.status_code)
-                break
-
-            data = response.json()
-            releases = data.get("releases", [])
-
-            if not releases:
-                print("No more releases. End reached.")
-                break
-
-            for release in releases:
-                ocid = release.get("ocid")
-                if not ocid or ocid in seen_ocids:
-                    continue
-
-                tender = release.get("tender", {})
-                cpv = extract_cpv(tender, release)
-
-                if cpv == "UNKNOWN":
-                    continue
-
-                if not any(cpv.startswith(prefix) for prefix in CIVIL_WORKS_CPVS):
-                    continue
-
-                amount, currency = extract_value(tender, release)
-
-                buyer = release.get("buyer") or {}
-                parties = release.get("parties") or []
-
-                buyer_country = "GB"
-                for p in parties:
-                    if p.get("id") == buyer.get("id"):
-                        buyer_country = (p.get("address") or {}).get("countryName", "GB")
-
-                all_contracts.append({
-                    "ocid": ocid,
-                    "title": tender.get("title", "Unknown"),
-                    "description": (tender.get("description") or "")[:500],
-                    "cpv_code": cpv,
-                    "value_amount": amount,
-                    "currency": currency,
-                    "published_date": release.get("date"),
-                    "buyer_name": buyer.get("name", "Unknown"),
-                    "buyer_country": buyer_country,
-                    "tender_status": tender.get("status"),
-                    "source": "UK Contracts Finder"
-                })
-
-                seen_ocids.add(ocid)
-
-            # Pagination 
-            if data.get("links") and data["links"].get("next"):
-                next_url = data["links"]["next"]
-                save_last_cursor(next_url)
-            else:
-                print("Pagination complete.")
-                break
-
-            time.sleep(SLEEP_SECONDS)
-
-    except Exception as e:
-        print("[CRITICAL] Ingestion interrupted:", e)
-
-
-    # SAVE OUTPUT 
-   
-    print(f"\n--- DONE. Total 2025 construction contracts: {len(all_contracts)} ---")
-
-    if all_contracts:
-        df = pd.DataFrame(all_contracts)
-        df.drop_duplicates(subset="ocid", inplace=True)
-        df.to_csv(OUTPUT_FILE, index=False)
+    if not df.empty:
         print(f"Saved to {OUTPUT_FILE}")
         print(df[["title", "value_amount", "cpv_code"]].head(10))
     else:
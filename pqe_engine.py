@@ -1,58 +1,125 @@
 import pandas as pd
+import numpy as np
+import ahocorasick
 import os
 import re
+from functools import lru_cache
+from pathlib import Path
+from joblib import Parallel, delayed, effective_n_jobs
+from table_io import read_table, write_csv
 
 # --- CONFIGURATION ---
-INPUT_FILENAME = "2025_CIVIL_WORKS_CLEANED.csv"   
+INPUT_FILENAME = "2025_CIVIL_WORKS_CLEANED.parquet"   
 REF_FILENAME = "material_reference.csv"
 OUTPUT_FILENAME = "2025_CARBON_RISK_SCREENED.csv"
 MIN_SPEND_GBP = 5000
 
+_NON_NUM = re.compile(r"[^\d.]")
 
+
+@lru_cache(maxsize=128)
 def find_file_in_project(filename):
-    """Search project tree for filename."""
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-    for root, _, files in os.walk(project_root):
-        if filename in files:
-            return os.path.join(root, filename)
-    return None
+    """Search project tree for filename (cached per filename)."""
+    project_root = Path(__file__).resolve().parent.parent
+    match = next(project_root.rglob(filename), None)
+    return str(match) if match else None
 
 
 def clean_currency(val):
     """Return float parsed from messy currency strings (0.0 on failure)."""
     try:
-        clean_str = re.sub(r"[^\d.]", "", str(val))
+        clean_str = _NON_NUM.sub("", str(val))
         return float(clean_str) if clean_str else 0.0
     except Exception:
         return 0.0
 
 
-def detect_material(text, ref_df):
+def material_keywords(ref_df):
     """
-    Return a material row as a dict based on keyword matching.
-    Row order in ref_df should be most-specific -> generic.
+    Return [(material_id, keywords)] in ref_df order with keywords split,
+    stripped and lowercased once. MAT_GEN (the fallback) is left out.
     """
-    text = str(text).lower()
-    for _, row in ref_df.iterrows():
-        if str(row.get("material_id", "")).upper() == "MAT_GEN":
+    material_kw = []
+    rows = zip(ref_df["material_id"], ref_df["keywords"].fillna("").astype(str))
+    for material_id, keywords in rows:
+        if str(material_id).upper() == "MAT_GEN":
             continue
-        keywords = [k.strip().lower() for k in str(row.get("keywords", "")).split("|") if k.strip()]
-        if any(k and k in text for k in keywords):
-            return row.to_dict()
+        material_kw.append((material_id, [k.strip().lower() for k in keywords.split("|") if k.strip()]))
+    return material_kw
+
+
+def build_keyword_automaton(material_kw):
+    """
+    Build one Aho-Corasick automaton mapping every keyword to
+    (priority, material_id), priority being the material's position.
+    """
+    keyword_map = {}
+    for priority, (material_id, keywords) in enumerate(material_kw):
+        for k in keywords:
+            # shared keywords (e.g. "beam") belong to the most specific row
+            keyword_map.setdefault(k, (priority, material_id))
+
+    if not keyword_map:
+        return None
+
+    automaton = ahocorasick.Automaton()
+    for k, value in keyword_map.items():
+        automaton.add_word(k, value)
+    automaton.make_automaton()
+    return automaton
+
+
+def match_material(text, automaton):
+    """Return the highest-priority material_id whose keyword occurs in text."""
+    best = min((value for _, value in automaton.iter(text)), default=None)
+    return best[1] if best else None
+
+
+def match_chunk(texts, automaton):
+    """Run match_material over a Series of lowercased texts."""
+    return texts.map(lambda text: match_material(text, automaton)).astype(object)
+
+
+def detect_material(contracts, material_kw, gen_id=None, n_jobs=1):
+    """
+    Return the detected material_id for every contract, gen_id if unmatched.
+    material_kw should be ordered most-specific -> generic; the first
+    material whose keywords appear in the title/description wins.
+    n_jobs > 1 (or -1 for every usable core) splits the scan across
+    processes; pool start-up outweighs the serial scan at this data's size.
+    """
+    full_text = (
+        contracts["title"].fillna("").astype(str) + " " +
+        contracts["description"].fillna("").astype(str)
+    ).str.lower()
+    detected = pd.Series(None, index=contracts.index, dtype=object)
+
+    automaton = build_keyword_automaton(material_kw)
+    if automaton is not None and n_jobs != 1:
+        # pyahocorasick holds the GIL while scanning, so split across processes
+        n_chunks = effective_n_jobs(n_jobs)
+        chunks = [full_text.iloc[idx] for idx in np.array_split(np.arange(len(full_text)), n_chunks)]
+        parts = Parallel(n_jobs=n_jobs)(delayed(match_chunk)(chunk, automaton) for chunk in chunks)
+        detected = pd.concat(parts)
+    elif automaton is not None:
+        detected = match_chunk(full_text, automaton)
+
     # fallback
-    gen = ref_df[ref_df["material_id"] == "MAT_GEN"]
-    if not gen.empty:
-        return gen.iloc[0].to_dict()
-    return None
+    if gen_id is not None:
+        detected = detected.fillna(gen_id)
+    return detected
 
 
 def run_pqe_engine():
     print("--- Starting PQE Engine ---")
 
-    input_path = find_file_in_project(INPUT_FILENAME)
+    # Fall back to the CSV export when the Parquet intermediate is absent.
+    input_path = (
+        find_file_in_project(INPUT_FILENAME) or
+        find_file_in_project(INPUT_FILENAME.replace(".parquet", ".csv"))
+    )
     if not input_path:
-        print(f"Error: Could not find '{INPUT_FILENAME}'. Place cleaned CSV in project.")
+        print(f"Error: Could not find '{INPUT_FILENAME}'. Place cleaned data in project.")
         return
 
     ref_path = find_file_in_project(REF_FILENAME)
@@ -60,88 +127,80 @@ def run_pqe_engine():
         print(f"Error: Could not find '{REF_FILENAME}'.")
         return
 
-    contracts = pd.read_csv(input_path, encoding="utf-8-sig")
-    materials = pd.read_csv(ref_path, encoding="utf-8-sig")
-
-    print(f"Loaded {len(contracts)} contracts and {len(materials)} material profiles.")
-
-    results = []
+    contracts = read_table(input_path)
+    materials = read_table(ref_path)
 
-    for _, row in contracts.iterrows():
-        title = row.get("title", "") or ""
-        description = row.get("description", "") or ""
-        full_text = f"{title} {description}"
-        spend_gbp = clean_currency(row.get("value_amount", 0))
+    # Low-cardinality text columns as categories. value_amount stays float64:
+    # reported tonnages need more significant digits than float32 holds.
+    contracts = contracts.astype({
+        "cpv_code": "category",
+        "currency": "category",
+        "buyer_country": "category"
+    })
 
-        if spend_gbp < MIN_SPEND_GBP:
-            r = row.to_dict()
-            r["pqe_status"] = "SKIPPED_LOW_VALUE"
-            results.append(r)
-            continue
-
-        mat = detect_material(full_text, materials)
-        if not mat:
-            r = row.to_dict()
-            r["pqe_status"] = "SKIPPED_NO_REF"
-            results.append(r)
-            continue
-
-        # safe numeric extraction
-        try:
-            price = float(mat.get("composite_price_gbp_per_tonne") or 0)
-        except Exception:
-            price = 0.0
-        try:
-            factor = float(mat.get("carbon_factor_kgco2e_per_tonne") or 0)
-        except Exception:
-            factor = 0.0
-
-        if price <= 0 or factor <= 0:
-            r = row.to_dict()
-            r["pqe_status"] = "SKIPPED_INVALID_REF"
-            r["ref_price"] = mat.get("composite_price_gbp_per_tonne")
-            r["ref_factor"] = mat.get("carbon_factor_kgco2e_per_tonne")
-            results.append(r)
-            continue
+    print(f"Loaded {len(contracts)} contracts and {len(materials)} material profiles.")
 
-        est_tonnes = spend_gbp / price
-        est_co2e = (est_tonnes * factor) / 1000.0
-        low_bound = est_co2e * 0.75
-        high_bound = est_co2e * 1.25
-
-        if est_co2e >= 1000:
-            risk = "CRITICAL"
-        elif est_co2e >= 250:
-            risk = "HIGH"
-        elif est_co2e >= 50:
-            risk = "MEDIUM"
-        else:
-            risk = "LOW"
-
-        r = row.to_dict()
-        r.update({
-            "pqe_status": "CALCULATED",
-            "detected_material_id": mat.get("material_id"),
-            "detected_material_name": mat.get("material_name"),
-            "applied_price_rate": price,
-            "applied_carbon_factor": factor,
-            "est_material_tonnes": round(est_tonnes, 2),
-            "est_co2e_tonnes": round(est_co2e, 2),
-            "co2e_range_low": round(low_bound, 2),
-            "co2e_range_high": round(high_bound, 2),
-            "risk_category": risk,
-            "data_source_ref": mat.get("ice_source_ref")
-        })
-        results.append(r)
-
-    out_df = pd.DataFrame(results)
-
-    if "est_co2e_tonnes" in out_df.columns:
-        out_df["sort_helper"] = out_df["est_co2e_tonnes"].fillna(-1)
-        out_df = out_df.sort_values(by="sort_helper", ascending=False).drop(columns=["sort_helper"])
+    material_kw = material_keywords(materials)
+    gen_id = "MAT_GEN" if (materials["material_id"] == "MAT_GEN").any() else None
+    detected = detect_material(contracts, material_kw, gen_id)
+    ref = materials.drop_duplicates(subset="material_id").set_index("material_id")
+
+    if pd.api.types.is_numeric_dtype(contracts["value_amount"]):
+        # already parsed upstream - skip the string round-trip
+        spend = contracts["value_amount"].astype("float64").abs().fillna(0.0)
+    else:
+        spend = pd.to_numeric(
+            contracts["value_amount"].astype(str).str.replace(_NON_NUM, "", regex=True),
+            errors="coerce"
+        ).fillna(0.0)
+
+    # safe numeric extraction
+    raw_price = detected.map(ref["composite_price_gbp_per_tonne"])
+    raw_factor = detected.map(ref["carbon_factor_kgco2e_per_tonne"])
+    price = pd.to_numeric(raw_price, errors="coerce").fillna(0.0)
+    factor = pd.to_numeric(raw_factor, errors="coerce").fillna(0.0)
+
+    low_value = spend < MIN_SPEND_GBP
+    no_ref = ~low_value & ~detected.isin(ref.index)
+    bad_ref = ~low_value & ~no_ref & ((price <= 0) | (factor <= 0))
+    ok = ~low_value & ~no_ref & ~bad_ref
+
+    est_tonnes = (spend / price).where(ok)
+    est_co2e = (est_tonnes * factor) / 1000.0
+    risk = pd.cut(
+        est_co2e,
+        bins=[-np.inf, 50, 250, 1000, np.inf],
+        labels=["LOW", "MEDIUM", "HIGH", "CRITICAL"],
+        right=False
+    ).astype(object)
+
+    out_df = contracts.copy()
+    out_df["pqe_status"] = np.select(
+        [low_value, no_ref, bad_ref],
+        ["SKIPPED_LOW_VALUE", "SKIPPED_NO_REF", "SKIPPED_INVALID_REF"],
+        default="CALCULATED"
+    )
+    if bad_ref.any():
+        out_df["ref_price"] = raw_price.where(bad_ref)
+        out_df["ref_factor"] = raw_factor.where(bad_ref)
+
+    out_df["detected_material_id"] = detected.where(ok)
+    out_df["detected_material_name"] = detected.map(ref["material_name"]).where(ok)
+    out_df["applied_price_rate"] = price.where(ok)
+    out_df["applied_carbon_factor"] = factor.where(ok)
+    out_df["est_material_tonnes"] = est_tonnes.round(2)
+    out_df["est_co2e_tonnes"] = est_co2e.round(2)
+    out_df["co2e_range_low"] = (est_co2e * 0.75).round(2)
+    out_df["co2e_range_high"] = (est_co2e * 1.25).round(2)
+    out_df["risk_category"] = risk.where(ok)
+    out_df["data_source_ref"] = detected.map(ref["ice_source_ref"]).where(ok)
+
+    out_df = out_df.sort_values(
+        by="est_co2e_tonnes", ascending=False, na_position="last", kind="mergesort"
+    )
 
     output_path = os.path.join(os.path.dirname(input_path), OUTPUT_FILENAME)
-    out_df.to_csv(output_path, index=False, encoding="utf-8-sig")
+    write_csv(out_df, output_path, bom=True)
     print(f"Saved output to: {output_path}")
 
     if not out_df.empty:
@@ -0,0 +1,31 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+
+def read_table(path, column_types=None):
+    """
+    Read a Parquet intermediate, or a CSV via Arrow's multithreaded parser.
+    column_types overrides the CSV's inferred Arrow types per column.
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    # contract descriptions can span lines; keep published_date as text
+    types = {"published_date": pa.string(), **(column_types or {})}
+    table = pa_csv.read_csv(
+        path,
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=types,
+            strings_can_be_null=True
+        )
+    )
+    return table.to_pandas()
+
+
+def write_csv(df, path, bom=False):
+    """Write df with Arrow's multithreaded CSV writer (optionally with a UTF-8 BOM for Excel)."""
+    with open(path, "wb") as f:
+        if bom:
+            f.write(b"\xef\xbb\xbf")
+        pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), f)